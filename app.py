@@ -1,87 +1,13 @@
 import streamlit as st
-import openpyxl
-from openpyxl.styles import PatternFill
 from PIL import Image
-import io
 import os
 
-# --- Core Image to Excel Conversion Logic ---
-
-def image_to_excel_pixel_art(image_data, should_resize, max_size, resampling_method, num_colors):
-    """
-    Convert an image to Excel pixel art with color quantization to prevent corruption.
-    """
-    img = Image.open(image_data)
-    
-    if img.mode != 'RGB':
-        img = img.convert('RGB')
-    
-    # --- STEP 1: RESIZE (if requested) ---
-    if should_resize:
-        width, height = img.size
-        if width > max_size or height > max_size:
-            ratio = min(max_size / width, max_size / height)
-            new_width = int(width * ratio)
-            new_height = int(height * ratio)
-            img = img.resize((new_width, new_height), resampling_method)
-            st.info(f"Resized image from {width}x{height} to {new_width}x{new_height}.")
-    else:
-        st.warning("Processing image at original size. This may be very slow.")
-
-    # --- STEP 2: QUANTIZE COLORS (Crucial for preventing corruption) ---
-    # Reduce the number of unique colors in the image.
-    # This prevents hitting Excel's style limit.
-    st.info(f"Reducing image to a palette of {num_colors} colors...")
-    # The 'dither=Image.Dither.NONE' option can be faster but looks less natural.
-    # FLOYDSTEINBERG is higher quality.
-    quantized_img = img.quantize(colors=num_colors, method=Image.MAXCOVERAGE, dither=Image.Dither.FLOYDSTEINBERG)
-    # quantize() returns a 'P' (palette) mode image. We need to convert it back to RGB
-    # so we can get the (R, G, B) value of each pixel.
-    img = quantized_img.convert('RGB')
-    st.info("Color reduction complete.")
-
-    width, height = img.size
-    
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "Pixel Art"
-    
-    for col_idx in range(1, width + 1):
-        ws.column_dimensions[openpyxl.utils.get_column_letter(col_idx)].width = 2.0
-    
-    for row_idx in range(1, height + 1):
-        ws.row_dimensions[row_idx].height = 12.0
-    
-    fill_cache = {}
-    
-    progress_bar = st.progress(0, text="Processing pixels...")
-    
-    for y in range(height):
-        for x in range(width):
-            r, g, b = img.getpixel((x, y))
-            hex_color = f"{r:02x}{g:02x}{b:02x}"
-            
-            if hex_color in fill_cache:
-                fill = fill_cache[hex_color]
-            else:
-                fill = PatternFill(start_color=hex_color, end_color=hex_color, fill_type="solid")
-                fill_cache[hex_color] = fill
-            
-            cell = ws.cell(row=y + 1, column=x + 1)
-            cell.fill = fill
-        
-        progress_percentage = (y + 1) / height
-        progress_bar.progress(progress_percentage)
-            
-    ws.sheet_view.showGridLines = False
-    
-    progress_bar.progress(1.0, text="Finalizing Excel file...")
-    buffer = io.BytesIO()
-    wb.save(buffer)
-    buffer.seek(0)
-    
-    st.success("Conversion Complete!")
-    return buffer
+from pixel_art_core import (
+    image_to_excel_pixel_art,
+    image_to_png_pixel_art,
+    image_to_svg_pixel_art,
+    peek_image_size,
+)
 
 # --- Streamlit User Interface ---
 
@@ -93,10 +19,34 @@ st.sidebar.header("⚙️ Settings")
 # Color Palette Size
 num_colors = st.sidebar.slider(
     "🎨 Number of Colors", 
-    min_value=8, 
-    max_value=256, 
+    min_value=8,
+    max_value=256,
     value=128,
-    help="Fewer colors = faster processing and smaller files. More colors = higher fidelity. Recommended to keep below 256."
+    help="Fewer colors = faster processing and smaller files. More colors = higher fidelity. 256 is the most a palette image can hold."
+)
+
+# Custom Palette
+custom_palette_text = st.sidebar.text_input(
+    "Custom palette (optional)",
+    "",
+    help="Comma-separated hex colors, e.g. '#ff0000, #00ff00, #0000ff'. When set, every pixel is mapped to its nearest listed color and the color count above is ignored."
+)
+custom_palette = tuple(c.strip() for c in custom_palette_text.split(",") if c.strip()) or None
+
+# Dithering
+dither_choice = st.sidebar.selectbox(
+    "Dither",
+    ["None", "Floyd-Steinberg"],
+    help="Floyd-Steinberg dithering looks more natural but is slower. 'None' is recommended for large images."
+)
+
+# Output Format
+# Excel is the point of the app, but it pays a styled cell per color run;
+# SVG and PNG render the same pixel art in milliseconds at any size.
+output_format = st.sidebar.radio(
+    "Output format",
+    ["Excel (.xlsx)", "SVG pixel grid", "PNG upscale"],
+    help="Excel is slow for large images. SVG and PNG produce the same visual instantly."
 )
 
 st.sidebar.markdown("---")
@@ -112,9 +62,8 @@ uploaded_file = st.file_uploader("Choose an image file", type=['png', 'jpg', 'jp
 
 if uploaded_file is not None:
     if not resize_image:
-        img_peek = Image.open(uploaded_file)
-        width, height = img_peek.size
-        uploaded_file.seek(0)
+        # Header-only peek; the converter reuses the same rewound stream.
+        width, height = peek_image_size(uploaded_file)
         st.error(f"**WARNING:** You are processing at original size ({width}x{height}). This will be VERY slow and may fail. Resizing is highly recommended.")
 
     st.image(uploaded_file, caption="Your Uploaded Image", use_column_width=True)
@@ -122,20 +71,31 @@ if uploaded_file is not None:
     if st.button("🎨 Convert to Excel Art"):
         with st.spinner("Processing... This may take several minutes."):
             try:
-                excel_buffer = image_to_excel_pixel_art(
-                    uploaded_file, 
-                    should_resize=resize_image, 
-                    max_size=max_size, 
+                convert_kwargs = dict(
+                    should_resize=resize_image,
+                    max_size=max_size,
                     resampling_method=selected_method,
-                    num_colors=num_colors
+                    num_colors=num_colors,
+                    dither=dither_choice,
+                    custom_palette=custom_palette
                 )
-                
+
                 original_filename = uploaded_file.name
                 base_filename = os.path.splitext(original_filename)[0]
                 size_str = f"{max_size}px" if resize_image else "original"
-                excel_filename = f"{base_filename}_{size_str}_{num_colors}colors_art.xlsx"
+                art_filename = f"{base_filename}_{size_str}_{num_colors}colors_art"
 
-                st.download_button("📥 Download Excel File", excel_buffer, excel_filename, "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+                if output_format == "Excel (.xlsx)":
+                    excel_path = image_to_excel_pixel_art(uploaded_file, **convert_kwargs)
+                    # Hand download_button an open file handle so the result is
+                    # streamed from disk instead of being held in memory.
+                    st.download_button("📥 Download Excel File", open(excel_path, "rb"), art_filename + ".xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+                elif output_format == "SVG pixel grid":
+                    svg_text = image_to_svg_pixel_art(uploaded_file, **convert_kwargs)
+                    st.download_button("📥 Download SVG File", svg_text, art_filename + ".svg", "image/svg+xml")
+                else:
+                    png_buffer = image_to_png_pixel_art(uploaded_file, **convert_kwargs)
+                    st.download_button("📥 Download PNG File", png_buffer, art_filename + ".png", "image/png")
             except Exception as e:
                 st.error(f"An error occurred: {e}")
                 st.error("This can happen if the image is too large. Try enabling resizing or reducing the color count.")
\ No newline at end of file
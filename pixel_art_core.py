@@ -0,0 +1,421 @@
+import streamlit as st
+from pyexcelerate import Color, Fill, Style, Workbook
+from PIL import Image
+import numpy as np
+import atexit
+import functools
+import io
+import os
+import tempfile
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+# Below this pixel count PIL's own dithering is cheap enough that paying the
+# one-time Numba compile is not worth it.
+NUMBA_DITHER_THRESHOLD = 128 * 128
+
+# Precomputed two-char hex for every byte value: concatenating three table
+# entries is noticeably faster than running the format mini-language per
+# channel in a loop.
+_HEX = [f"{i:02x}" for i in range(256)]
+
+# Refuse un-resized conversions above this pixel count before decoding
+# anything; a sheet this large is already impractical and bigger ones risk
+# running the server out of memory.
+MAX_CELLS = 1_000_000
+
+
+def peek_image_size(image_data):
+    """
+    Return (width, height) without decoding any pixel data.
+
+    Image.open only parses the header, so this is cheap even for huge files.
+    Rewinds the stream so the caller can reuse it.
+    """
+    with Image.open(image_data) as img:
+        size = img.size
+    image_data.seek(0)
+    return size
+
+
+@st.cache_resource(show_spinner=False)
+def _get_fs_dither():
+    """
+    Build (or fetch) the JIT-compiled Floyd-Steinberg kernel.
+
+    cache_resource keeps the compiled function alive for the whole Streamlit
+    process, so the Numba compile cost is paid at most once per server.
+    Returns None when Numba is not installed.
+    """
+    if njit is None:
+        return None
+
+    @njit(parallel=False, cache=True)
+    def _fs_dither(pixels, palette, idx_out):
+        """
+        Floyd-Steinberg dithering against a fixed palette.
+
+        pixels:  (H, W, 3) float32 RGB in [0, 1], modified in place.
+        palette: (N, 3) float32 RGB in [0, 1].
+        idx_out: (H, W) uint8, receives the palette index per pixel.
+        """
+        height, width = idx_out.shape
+        n_pal = palette.shape[0]
+        for y in range(height):
+            for x in range(width):
+                r = pixels[y, x, 0]
+                g = pixels[y, x, 1]
+                b = pixels[y, x, 2]
+                best = 0
+                best_dist = np.inf
+                for i in range(n_pal):
+                    dr = r - palette[i, 0]
+                    dg = g - palette[i, 1]
+                    db = b - palette[i, 2]
+                    dist = dr * dr + dg * dg + db * db
+                    if dist < best_dist:
+                        best_dist = dist
+                        best = i
+                idx_out[y, x] = best
+                err_r = r - palette[best, 0]
+                err_g = g - palette[best, 1]
+                err_b = b - palette[best, 2]
+                if x + 1 < width:
+                    pixels[y, x + 1, 0] += err_r * (7.0 / 16.0)
+                    pixels[y, x + 1, 1] += err_g * (7.0 / 16.0)
+                    pixels[y, x + 1, 2] += err_b * (7.0 / 16.0)
+                if y + 1 < height:
+                    if x > 0:
+                        pixels[y + 1, x - 1, 0] += err_r * (3.0 / 16.0)
+                        pixels[y + 1, x - 1, 1] += err_g * (3.0 / 16.0)
+                        pixels[y + 1, x - 1, 2] += err_b * (3.0 / 16.0)
+                    pixels[y + 1, x, 0] += err_r * (5.0 / 16.0)
+                    pixels[y + 1, x, 1] += err_g * (5.0 / 16.0)
+                    pixels[y + 1, x, 2] += err_b * (5.0 / 16.0)
+                    if x + 1 < width:
+                        pixels[y + 1, x + 1, 0] += err_r * (1.0 / 16.0)
+                        pixels[y + 1, x + 1, 1] += err_g * (1.0 / 16.0)
+                        pixels[y + 1, x + 1, 2] += err_b * (1.0 / 16.0)
+
+    return _fs_dither
+
+
+@functools.lru_cache(maxsize=32)
+def _build_styles(palette):
+    """
+    Build one solid-fill Style per palette entry.
+
+    palette is a flat (r, g, b, r, g, b, ...) tuple so it is hashable;
+    repeated conversions with the same palette in one session reuse the
+    same Style objects instead of rebuilding them.
+    """
+    n_pal = len(palette) // 3
+    return [
+        Style(fill=Fill(background=Color(palette[i * 3], palette[i * 3 + 1], palette[i * 3 + 2])))
+        for i in range(n_pal)
+    ]
+
+
+def _prepare_quantized(image_data, *, should_resize, max_size, resampling_method, num_colors, dither, custom_palette=None):
+    """
+    Open, optionally resize, and quantize an image down to a small palette.
+
+    When custom_palette (a sequence of hex color strings) is given, pixels
+    are mapped to their nearest palette entry instead of running PIL's
+    quantizer. Returns a 'P' (palette) mode image; every output mode works
+    from its palette indices.
+    """
+    img = Image.open(image_data)
+
+    # Image.open is lazy -- only the header has been parsed at this point --
+    # so an impossible input is rejected before a single pixel is decoded.
+    if not should_resize and img.width * img.height > MAX_CELLS:
+        raise ValueError(
+            f"Image has {img.width * img.height:,} pixels; the maximum without resizing is {MAX_CELLS:,}. "
+            "Enable resizing to convert this image."
+        )
+
+    # The true upload dimensions, captured before draft() can shrink the
+    # decode size for JPEGs.
+    orig_width, orig_height = img.size
+
+    # draft() asks the decoder for a reduced-size decode; for JPEGs this can
+    # cut the initial decode by up to 8x. It must run before the image is
+    # loaded (a convert() would trigger that), and is a no-op for formats
+    # that do not support it.
+    if should_resize:
+        img.draft('RGB', (max_size, max_size))
+
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+
+    # --- STEP 1: RESIZE (if requested) ---
+    if should_resize:
+        if orig_width > max_size or orig_height > max_size:
+            # thumbnail() does the aspect-preserving shrink in place, with a
+            # cheap box-filter pre-reduction (reducing_gap) before the real
+            # resampling pass.
+            img.thumbnail((max_size, max_size), resampling_method, reducing_gap=2.0)
+            st.info(f"Resized image from {orig_width}x{orig_height} to {img.width}x{img.height}.")
+    else:
+        st.warning("Processing image at original size. This may be very slow.")
+
+    # --- STEP 2: QUANTIZE COLORS (Crucial for preventing corruption) ---
+    # Reduce the number of unique colors in the image.
+    # This prevents hitting Excel's style limit.
+    # 'P' (palette) images index with a single byte, so 256 colors is a hard
+    # ceiling -- PIL's quantize() refuses more -- and it also keeps us far
+    # below Excel's ~64k cell-format cap.
+    if num_colors > 256:
+        raise ValueError("num_colors must be 256 or fewer; palette images cannot hold more entries.")
+    use_dither = dither == "Floyd-Steinberg"
+    fs_dither = _get_fs_dither() if use_dither else None
+
+    if custom_palette:
+        # Same single-byte palette-index ceiling as the quantize path; a
+        # larger list would also silently wrap the uint8 index arrays.
+        if len(custom_palette) > 256:
+            raise ValueError("Custom palettes are limited to 256 colors.")
+        st.info(f"Mapping image to the {len(custom_palette)} supplied palette colors...")
+        pal = []
+        for color in custom_palette:
+            hex_color = color.lstrip('#').lower()
+            try:
+                pal.extend((int(hex_color[0:2], 16), int(hex_color[2:4], 16), int(hex_color[4:6], 16)))
+            except ValueError:
+                raise ValueError(f"Invalid palette color {color!r}: expected a hex color like #ff0000.")
+            if len(hex_color) != 6:
+                raise ValueError(f"Invalid palette color {color!r}: expected a hex color like #ff0000.")
+        # int32: a squared channel difference can reach 255**2 = 65025,
+        # which overflows int16 and turns far colors into "near" ones.
+        palette_np = np.asarray(pal, dtype=np.int32).reshape(-1, 3)
+        if use_dither and fs_dither is not None:
+            palette_f32 = palette_np.astype(np.float32) / 255.0
+            arr_f32 = np.array(img, dtype=np.float32) / 255.0
+            idx_out = np.zeros((img.height, img.width), dtype=np.uint8)
+            fs_dither(arr_f32, palette_f32, idx_out)
+        else:
+            # One broadcasted (pixels x palette) squared-distance computation
+            # instead of a Python loop over pixels.
+            flat = np.asarray(img, dtype=np.int32).reshape(-1, 3)
+            dists = ((flat[:, None, :] - palette_np[None, :, :]) ** 2).sum(-1)
+            idx_out = dists.argmin(1).astype(np.uint8).reshape(img.height, img.width)
+        quantized_img = Image.fromarray(idx_out, mode="P")
+        quantized_img.putpalette(pal)
+        st.info("Color reduction complete.")
+        return quantized_img
+
+    st.info(f"Reducing image to a palette of {num_colors} colors...")
+    # Dithering looks more natural but roughly doubles the quantize cost, so
+    # it is opt-in. MEDIANCUT is much faster than MAXCOVERAGE on photos with
+    # a very similar palette.
+    if use_dither and fs_dither is not None and img.width * img.height > NUMBA_DITHER_THRESHOLD:
+        # Large image: get the palette from a fast no-dither quantize, then
+        # run our JIT-compiled Floyd-Steinberg pass against it.
+        quantized_img = img.quantize(colors=num_colors, method=Image.Quantize.MEDIANCUT, dither=Image.Dither.NONE)
+        pal = quantized_img.getpalette()
+        palette_f32 = np.asarray(pal, dtype=np.float32).reshape(-1, 3) / 255.0
+        arr_f32 = np.array(img, dtype=np.float32) / 255.0
+        idx_out = np.zeros((img.height, img.width), dtype=np.uint8)
+        fs_dither(arr_f32, palette_f32, idx_out)
+        # Re-wrap the dithered indices as a 'P' image so the rest of the
+        # pipeline does not care which dither path ran.
+        quantized_img = Image.fromarray(idx_out, mode="P")
+        quantized_img.putpalette(pal)
+    else:
+        pil_dither = Image.Dither.FLOYDSTEINBERG if use_dither else Image.Dither.NONE
+        quantized_img = img.quantize(colors=num_colors, method=Image.Quantize.MEDIANCUT, dither=pil_dither)
+    # quantize() returns a 'P' (palette) mode image; we work directly from its
+    # palette indices, so no conversion back to RGB is needed.
+    st.info("Color reduction complete.")
+
+    return quantized_img
+
+
+@st.cache_data(show_spinner=False)
+def _prepare_pixels(image_bytes, should_resize, max_size, resampling_value, num_colors, dither, custom_palette):
+    """
+    Cacheable wrapper around _prepare_quantized.
+
+    Takes only hashable arguments and returns plain bytes/tuples so
+    Streamlit can key the cache on the inputs: a rerun that only touched
+    output-side widgets skips the decode/resize/quantize work entirely.
+    """
+    quantized_img = _prepare_quantized(
+        io.BytesIO(image_bytes),
+        should_resize=should_resize,
+        max_size=max_size,
+        resampling_method=Image.Resampling(resampling_value),
+        num_colors=num_colors,
+        dither=dither,
+        custom_palette=custom_palette,
+    )
+    idx_arr = np.asarray(quantized_img, dtype=np.uint8)
+    return idx_arr.tobytes(), tuple(quantized_img.getpalette()), quantized_img.width, quantized_img.height
+
+
+def _quantized_pixels(image_data, *, should_resize, max_size, resampling_method, num_colors, dither, custom_palette):
+    """
+    Fetch the (idx_arr, palette) pair for an upload through the prep cache.
+    """
+    image_bytes = image_data.getvalue() if hasattr(image_data, "getvalue") else image_data.read()
+    idx_bytes, palette, width, height = _prepare_pixels(
+        image_bytes, should_resize, max_size, int(resampling_method), num_colors, dither, custom_palette
+    )
+    idx_arr = np.frombuffer(idx_bytes, dtype=np.uint8).reshape(height, width)
+    return idx_arr, palette
+
+
+def image_to_excel_pixel_art(image_data, *, should_resize, max_size, resampling_method, num_colors, dither="None", custom_palette=None):
+    """
+    Convert an image to Excel pixel art with color quantization to prevent corruption.
+    """
+    idx_arr, palette = _quantized_pixels(
+        image_data,
+        should_resize=should_resize,
+        max_size=max_size,
+        resampling_method=resampling_method,
+        num_colors=num_colors,
+        dither=dither,
+        custom_palette=custom_palette,
+    )
+    height, width = idx_arr.shape
+
+    # pyexcelerate skips the cell object model entirely and serializes styles
+    # straight to XML, which is multiples faster than openpyxl for this
+    # write-once workload.
+    wb = Workbook()
+    ws = wb.new_sheet("Pixel Art")
+    ws.show_grid_lines = False
+
+    # pyexcelerate has no sheet-wide default dimensions, so size each used
+    # column and row once. These are plain dict writes, not cell objects.
+    col_style = Style(size=2.0)
+    row_style = Style(size=12.0)
+    for x in range(1, width + 1):
+        ws.set_col_style(x, col_style)
+    for y in range(1, height + 1):
+        ws.set_row_style(y, row_style)
+
+    progress_bar = st.progress(0, text="Processing pixels...")
+    # Each progress() call is a websocket round-trip to the browser, so only
+    # push an update when the visible integer percentage actually changes.
+    last_pct = -1
+
+    # quantize() already assigned every pixel a palette index, so build one
+    # Style per palette entry up front (at most num_colors of them) and let
+    # the inner loop do a plain list lookup -- no dict hashing, no hex
+    # formatting, no cache-miss branch per pixel.
+    styles = _build_styles(palette)
+
+    # Quantized pixel art has long horizontal runs of a single color, so
+    # run-length encode each row: one styled cell plus a merged range per
+    # run, cutting both styled-cell count and file size.
+    # Range.merge() scans every previously registered merge for
+    # intersections, which is O(n^2) over tens of thousands of runs. Rows
+    # are emitted left to right and never overlap by construction, so
+    # register the ranges directly.
+    merges = ws._merges
+    for y in range(height):
+        idx_row = idx_arr[y]
+        run_bounds = np.flatnonzero(np.diff(idx_row)) + 1
+        starts = np.concatenate(([0], run_bounds)).tolist()
+        ends = np.concatenate((run_bounds, [width])).tolist()
+        # tolist() converts to native Python ints in bulk, which is faster
+        # than pulling values out of the ndarray one element at a time.
+        row_vals = idx_row.tolist()
+
+        for start, end in zip(starts, ends):
+            if end - start > 1:
+                merges.append(ws.range((y + 1, start + 1), (y + 1, end)))
+            ws.set_cell_style(y + 1, start + 1, styles[row_vals[start]])
+
+        pct = (y + 1) * 100 // height
+        if pct != last_pct:
+            progress_bar.progress(pct / 100.0)
+            last_pct = pct
+
+    progress_bar.progress(1.0, text="Finalizing Excel file...")
+    # Save to a temp file rather than a BytesIO: holding the whole workbook
+    # in memory doubles the peak footprint, and on the no-resize path the
+    # file can be hundreds of MB. The download button streams it from disk.
+    tmp = tempfile.NamedTemporaryFile(suffix=".xlsx", delete=False)
+    tmp.close()
+    wb.save(tmp.name)
+    atexit.register(_remove_quietly, tmp.name)
+
+    st.success("Conversion Complete!")
+    return tmp.name
+
+
+def image_to_svg_pixel_art(image_data, *, should_resize, max_size, resampling_method, num_colors, dither="None", custom_palette=None):
+    """
+    Convert an image to an SVG pixel grid.
+
+    Unlike the xlsx path this is linear in the number of color runs, so it
+    stays fast even at sizes where a styled workbook would be enormous.
+    """
+    idx_arr, palette = _quantized_pixels(
+        image_data,
+        should_resize=should_resize,
+        max_size=max_size,
+        resampling_method=resampling_method,
+        num_colors=num_colors,
+        dither=dither,
+        custom_palette=custom_palette,
+    )
+    height, width = idx_arr.shape
+    n_pal = len(palette) // 3
+    hex_strs = [_HEX[palette[i * 3]] + _HEX[palette[i * 3 + 1]] + _HEX[palette[i * 3 + 2]] for i in range(n_pal)]
+
+    parts = [f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {width} {height}" shape-rendering="crispEdges">']
+    # Same run-length encoding as the Excel path: one <rect> per horizontal
+    # run instead of one per pixel.
+    for y in range(height):
+        idx_row = idx_arr[y]
+        run_bounds = np.flatnonzero(np.diff(idx_row)) + 1
+        starts = np.concatenate(([0], run_bounds)).tolist()
+        ends = np.concatenate((run_bounds, [width])).tolist()
+        row_vals = idx_row.tolist()
+        for start, end in zip(starts, ends):
+            parts.append(f'<rect x="{start}" y="{y}" width="{end - start}" height="1" fill="#{hex_strs[row_vals[start]]}"/>')
+    parts.append('</svg>')
+
+    st.success("Conversion Complete!")
+    return "".join(parts)
+
+
+def image_to_png_pixel_art(image_data, *, should_resize, max_size, resampling_method, num_colors, dither="None", custom_palette=None, scale=8):
+    """
+    Convert an image to an upscaled pixel-art PNG.
+
+    The NEAREST upscale is a single Pillow call that runs entirely in C.
+    """
+    idx_arr, palette = _quantized_pixels(
+        image_data,
+        should_resize=should_resize,
+        max_size=max_size,
+        resampling_method=resampling_method,
+        num_colors=num_colors,
+        dither=dither,
+        custom_palette=custom_palette,
+    )
+    height, width = idx_arr.shape
+    quantized_img = Image.fromarray(idx_arr, mode="P")
+    quantized_img.putpalette(list(palette))
+    buffer = io.BytesIO()
+    quantized_img.resize((width * scale, height * scale), Image.Resampling.NEAREST).save(buffer, "PNG")
+    buffer.seek(0)
+
+    st.success("Conversion Complete!")
+    return buffer
+
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass